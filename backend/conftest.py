@@ -0,0 +1,15 @@
+# backend/conftest.py
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # point the dataset at a fresh directory and forget anything cached from other tests
+    monkeypatch.setattr(main, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(main, "PRED_DIR", tmp_path / "predictions")
+    monkeypatch.setattr(main, "META_PATH", tmp_path / "metadata.json")
+    main._CACHE.update(mtime=None, last_update=None, rows=None, by_pollutant={})
+    main._META_CACHE.update(mtime=None, val={"last_update": None})
+    return TestClient(main.app)
@@ -1,10 +1,21 @@
 # backend/main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
 from pathlib import Path
-import io
+import os
+import shutil
+import tempfile
+import threading
+import time
 import json
 import datetime as dt
 
@@ -21,71 +32,334 @@ app.add_middleware(
 
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
-PRED_PATH = DATA_DIR / "predictions.parquet"  # efficient store
+PRED_DIR = DATA_DIR / "predictions"  # hive-partitioned parquet dataset, pollutant=/date=
 META_PATH = DATA_DIR / "metadata.json"
 
-def now_iso():
-    return dt.datetime.utcnow().isoformat()
+PRED_COLUMNS = ["timestamp","station_id","station_name","lat","lon","pollutant","prediction","lower_q","upper_q","observed"]
+# observed is optional, uploads without it store nulls
+REQUIRED_COLUMNS = set(PRED_COLUMNS) - {"observed"}
+# every upload is cast to one schema so files from different uploads read back as a single dataset
+PRED_SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("ns")),
+    ("station_id", pa.string()),
+    ("station_name", pa.string()),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("pollutant", pa.string()),
+    ("prediction", pa.float64()),
+    ("lower_q", pa.float64()),
+    ("upper_q", pa.float64()),
+    ("observed", pa.float64()),
+    ("upload_ns", pa.int64()),
+    ("date", pa.string()),
+])
+# a row re-sent by a later upload shadows earlier copies of the same key
+DEDUP_KEYS = ["timestamp", "station_id", "pollutant"]
+PARTITIONING = ds.partitioning(pa.schema([("pollutant", pa.string()), ("date", pa.string())]), flavor="hive")
+PARQUET_OPTIONS = ds.ParquetFileFormat().make_write_options(
+    compression="zstd",
+    compression_level=3,
+    use_dictionary=["station_id", "station_name"],
+    write_statistics=True,
+)
+# what arrow raises when an upload's values can't be conformed to PRED_SCHEMA
+CONFORM_ERRORS = (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError)
+# small row groups keep the per-group column stats selective
+ROW_GROUP_SIZE = 32_768
+# uploads above this size are streamed CSV -> parquet by polars instead of read into memory
+LARGE_UPLOAD_BYTES = 256 << 20
+
+# typed CSV parsing so arrow never has to infer the hot columns
+CSV_READ_OPTIONS = pv.ReadOptions(block_size=8 << 20)
+CSV_CONVERT_OPTIONS = pv.ConvertOptions(column_types={
+    "timestamp": pa.timestamp("ns"),
+    "lat": pa.float64(),
+    "lon": pa.float64(),
+    "prediction": pa.float64(),
+    "lower_q": pa.float64(),
+    "upper_q": pa.float64(),
+    "observed": pa.float64(),
+    "pollutant": pa.dictionary(pa.int32(), pa.string()),
+    "station_id": pa.dictionary(pa.int32(), pa.string()),
+})
+# Content-Encoding values /upload_arrow can decompress
+ARROW_ENCODINGS = {"zstd", "gzip"}
+# the same typing for the polars path, so large uploads never depend on what the first rows look like
+POLARS_CSV_OVERRIDES = {
+    "station_id": pl.String,
+    "station_name": pl.String,
+    "pollutant": pl.String,
+    "lat": pl.Float64,
+    "lon": pl.Float64,
+    "prediction": pl.Float64,
+    "lower_q": pl.Float64,
+    "upper_q": pl.Float64,
+    "observed": pl.Float64,
+}
+
+def format_ns(ns):
+    # timestamps are stored as integer epoch nanoseconds and only formatted when served
+    return dt.datetime.fromtimestamp(ns // 1_000_000_000, dt.UTC).isoformat(timespec="seconds")
 
-# simple metadata to indicate last update time
-def write_meta(ts=None):
-    meta = {"last_update": ts or now_iso()}
-    META_PATH.write_text(json.dumps(meta))
+# simple metadata to indicate last update time; it is rewritten after every
+# dataset write, so it also marks when cached reads must be refreshed
+def write_meta(ts_ns=None):
+    meta = {"last_update_ns": ts_ns or time.time_ns()}
+    # write-then-rename so readers never see a half-written file
+    tmp = META_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, META_PATH)
+
+# parsed metadata, re-read only when the file is swapped for a new one
+_META_CACHE = {"mtime": None, "val": {"last_update": None}}
+_META_LOCK = threading.Lock()
 
 def read_meta():
-    if META_PATH.exists():
-        return json.loads(META_PATH.read_text())
-    return {"last_update": None}
+    try:
+        st = META_PATH.stat()
+    except FileNotFoundError:
+        return {"last_update": None}
+    mtime = (st.st_mtime_ns, st.st_ino)
+    with _META_LOCK:
+        if _META_CACHE["mtime"] != mtime:
+            meta = json.loads(META_PATH.read_text())
+            if "last_update_ns" in meta:
+                meta = {"last_update": format_ns(meta["last_update_ns"])}
+            _META_CACHE.update(mtime=mtime, val=meta)
+        return _META_CACHE["val"]
+
+def _write_predictions(data):
+    """
+    Append a table (or a dataset, streamed batch by batch) to PRED_DIR.
+    Nothing on disk is deleted: files are written to a staging directory
+    and only moved into their partitions once the whole write succeeded,
+    so readers never open a half-written file and a failed upload leaves
+    the dataset as it was.
+    """
+    staging = DATA_DIR / f".staging-{time.time_ns()}"
+    try:
+        ds.write_dataset(
+            data,
+            staging,
+            format="parquet",
+            partitioning=PARTITIONING,
+            existing_data_behavior="overwrite_or_ignore",
+            basename_template=f"part-{time.time_ns()}-{{i}}.parquet",
+            max_rows_per_group=ROW_GROUP_SIZE,
+            file_options=PARQUET_OPTIONS,
+        )
+        for path in staging.rglob("*.parquet"):
+            dest = PRED_DIR / path.relative_to(staging)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, dest)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    write_meta()
+
+def _latest_rows(table):
+    # sort by key with the newest upload first, then keep the first row of every key
+    table = table.sort_by([(k, "ascending") for k in DEDUP_KEYS] + [("upload_ns", "descending")])
+    if table.num_rows < 2:
+        return table
+    same = None
+    for k in DEDUP_KEYS:
+        col = table.column(k)
+        eq = pc.fill_null(pc.equal(col.slice(1), col.slice(0, table.num_rows - 1)), False)
+        same = eq if same is None else pc.and_(same, eq)
+    keep = pa.concat_arrays([pa.array([True]), pc.invert(same).combine_chunks()])
+    return table.filter(keep)
+
+def _partitioned(table):
+    # conform to PRED_SCHEMA and derive the date partition key from the timestamp
+    if table.column("timestamp").null_count:
+        raise HTTPException(status_code=400, detail="Missing timestamp values")
+    try:
+        if "observed" not in table.column_names:
+            table = table.append_column("observed", pa.nulls(table.num_rows, pa.float64()))
+        table = table.select(PRED_COLUMNS)
+        table = table.set_column(5, "pollutant", table.column("pollutant").cast(pa.string()))
+        table = table.append_column("upload_ns", pa.repeat(pa.scalar(time.time_ns(), pa.int64()), table.num_rows))
+        table = table.append_column("date", pc.strftime(table.column("timestamp"), format="%Y-%m-%d"))
+        return table.cast(PRED_SCHEMA)
+    except CONFORM_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid column values: {e}")
+
+def _open_predictions():
+    # the explicit schema fills columns missing from older files (e.g. observed) with nulls
+    return ds.dataset(PRED_DIR, format="parquet", partitioning=PARTITIONING, schema=PRED_SCHEMA)
+
+def _latest_upload_window(dataset):
+    """
+    Filter for the default /predictions view: per pollutant, every date from
+    the first one covered by that pollutant's newest upload onwards. Only the
+    small key columns are scanned to find it.
+    """
+    keys = dataset.to_table(columns=["pollutant", "date", "upload_ns"])
+    # only real date partitions count, not e.g. a leftover date=__HIVE_DEFAULT_PARTITION__
+    keys = keys.filter(pc.fill_null(pc.match_substring_regex(keys.column("date"), r"^\d{4}-\d{2}-\d{2}$"), False))
+    expr = None
+    for pollutant in pc.unique(keys.column("pollutant")).to_pylist():
+        if pollutant is None:
+            continue
+        sub = keys.filter(pc.equal(keys.column("pollutant"), pollutant))
+        dates = sub.column("date")
+        newest = pc.max(sub.column("upload_ns"))
+        # files written before upload_ns existed carry nulls, those fall back to the whole history
+        if newest.is_valid:
+            dates = sub.filter(pc.equal(sub.column("upload_ns"), newest)).column("date")
+        cond = (ds.field("pollutant") == pollutant) & (ds.field("date") >= pc.min(dates).as_py())
+        expr = cond if expr is None else expr | cond
+    return expr
+
+def _load_predictions(since=None, pollutant=None):
+    """
+    Rows sorted by timestamp, newest copy of each re-sent row only. With
+    since=None the window is the one of _latest_upload_window.
+    """
+    if not PRED_DIR.exists():
+        return [], None
+    dataset = _open_predictions()
+    # pollutant and date are partition keys, so these filters only open the matching directories
+    if since:
+        expr = ds.field("date") >= since
+    else:
+        expr = _latest_upload_window(dataset)
+        if expr is None:
+            return [], read_meta().get("last_update")
+    if pollutant:
+        expr = expr & (ds.field("pollutant") == pollutant)
+    t = dataset.to_table(columns=PRED_COLUMNS + ["upload_ns"], filter=expr)
+    # uploads only ever append, resolve re-sent rows here; the result is in timestamp order
+    t = _latest_rows(t).select(PRED_COLUMNS)
+    # convert timestamp to str for JSON serialization (arrow's %S carries sub-seconds, so truncate first)
+    ts = t.column("timestamp").cast(pa.timestamp("s"), safe=False)
+    t = t.set_column(0, "timestamp", pc.strftime(ts, format="%Y-%m-%d %H:%M:%S"))
+    return t.to_pylist(), read_meta().get("last_update")
+
+# decoded rows of the default window, plus per-pollutant views that share the same row
+# dicts; dropped whenever the metadata file (rewritten after each upload) changes. sync
+# endpoints run on a threadpool, hence the lock
+_CACHE = {"mtime": None, "last_update": None, "rows": None, "by_pollutant": {}}
+_CACHE_LOCK = threading.Lock()
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-@app.get("/predictions")
-def get_predictions():
+@app.get("/predictions", response_class=ORJSONResponse)
+def get_predictions(pollutant: str | None = None, since: str | None = None):
     """
-    Return latest predictions as JSON.
+    Return latest predictions as JSON, sorted by timestamp.
     Optional query params:
         pollutant=NO2 or O3
+        since=YYYY-MM-DD (default: per pollutant, the dates covered by its newest upload onwards)
     """
-    if not PRED_PATH.exists():
+    if since is not None:
+        try:
+            since = dt.date.fromisoformat(since).isoformat()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid since date: {since}")
+        # explicit windows are ad hoc, read them straight from the dataset
+        rows, last_update = _load_predictions(since, pollutant)
+        return {"last_update": last_update, "rows": rows}
+    try:
+        st = META_PATH.stat()
+    except FileNotFoundError:
         return {"last_update": None, "rows": []}
-    df = pd.read_parquet(PRED_PATH)
-    # convert timestamp to iso str for JSON serialization
-    df = df.copy()
-    df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
-    rows = df.to_dict(orient="records")
-    return {"last_update": read_meta().get("last_update"), "rows": rows}
+    # the metadata file is swapped in, so the inode changes even if two writes share an mtime tick
+    mtime = (st.st_mtime_ns, st.st_ino)
+    with _CACHE_LOCK:
+        if _CACHE["mtime"] != mtime:
+            _CACHE.update(mtime=mtime, last_update=None, rows=None, by_pollutant={})
+        if _CACHE["rows"] is None:
+            _CACHE["rows"], _CACHE["last_update"] = _load_predictions()
+        rows = _CACHE["rows"]
+        if pollutant:
+            subset = _CACHE["by_pollutant"].get(pollutant)
+            if subset is None:
+                subset = [r for r in rows if r["pollutant"] == pollutant]
+                # don't let arbitrary unmatched filter values pile up in the cache
+                if subset:
+                    _CACHE["by_pollutant"][pollutant] = subset
+            rows = subset
+        return {"last_update": _CACHE["last_update"], "rows": rows}
+
+def _sink_large_csv(src):
+    """
+    Copy the upload to disk, convert it to a staging parquet with polars and
+    stream that into PRED_DIR, so peak memory is bounded by the row group
+    rather than the file. Returns the number of rows written.
+    """
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
+    staging = Path(tmp.name).with_suffix(".parquet")
+    try:
+        with tmp:
+            shutil.copyfileobj(src, tmp, length=1 << 20)
+        lf = pl.scan_csv(tmp.name, try_parse_dates=True, schema_overrides=POLARS_CSV_OVERRIDES)
+        columns = set(lf.collect_schema().names())
+        if not REQUIRED_COLUMNS.issubset(columns):
+            raise HTTPException(status_code=400, detail=f"Missing required columns: {REQUIRED_COLUMNS - columns}")
+        if "observed" not in columns:
+            lf = lf.with_columns(pl.lit(None, dtype=pl.Float64).alias("observed"))
+        lf = lf.select(PRED_COLUMNS).with_columns(
+            pl.lit(time.time_ns(), dtype=pl.Int64).alias("upload_ns"),
+            pl.col("timestamp").dt.strftime("%Y-%m-%d").alias("date"),
+        )
+        try:
+            lf.sink_parquet(staging, compression="zstd", compression_level=3, row_group_size=ROW_GROUP_SIZE, maintain_order=False)
+        except pl.exceptions.PolarsError as e:
+            raise HTTPException(status_code=400, detail=f"CSV parse error: {e}")
+        # rows without a timestamp would land in a date=__HIVE_DEFAULT_PARTITION__ directory
+        if pl.scan_parquet(staging).select(pl.col("timestamp").null_count()).collect().item():
+            raise HTTPException(status_code=400, detail="Missing timestamp values")
+        # the explicit schema casts whatever polars inferred while streaming into the dataset
+        try:
+            _write_predictions(ds.dataset(staging, format="parquet", schema=PRED_SCHEMA))
+        except CONFORM_ERRORS as e:
+            raise HTTPException(status_code=400, detail=f"Invalid column values: {e}")
+        # row count comes from the parquet footer, nothing is loaded into python
+        return pl.scan_parquet(staging).select(pl.len()).collect().item()
+    finally:
+        os.unlink(tmp.name)
+        staging.unlink(missing_ok=True)
 
 class PushResult(BaseModel):
     status: str
     rows_received: int
 
+# the upload endpoints parse and write synchronously, so they are plain defs that fastapi
+# runs on its threadpool instead of the event loop
 @app.post("/upload_csv", response_model=PushResult)
-async def upload_csv(file: UploadFile = File(...)):
+def upload_csv(file: UploadFile = File(...)):
     """
     Accepts a CSV file uploaded by backend or ingestion script.
     Expects columns:
     timestamp,station_id,station_name,lat,lon,pollutant,prediction,lower_q,upper_q[,observed]
     """
-    contents = await file.read()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    if size >= LARGE_UPLOAD_BYTES:
+        rows_received = _sink_large_csv(file.file)
+        return {"status": "ok", "rows_received": rows_received}
+
+    # parse straight from the spooled upload, no in-memory copy of the body
     try:
-        df = pd.read_csv(io.BytesIO(contents), parse_dates=["timestamp"], infer_datetime_format=True)
+        table = pv.read_csv(file.file, read_options=CSV_READ_OPTIONS, convert_options=CSV_CONVERT_OPTIONS)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"CSV parse error: {e}")
 
     # basic validation
-    required = {"timestamp","station_id","station_name","lat","lon","pollutant","prediction","lower_q","upper_q"}
-    if not required.issubset(set(df.columns)):
-        raise HTTPException(status_code=400, detail=f"Missing required columns: {required - set(df.columns)}")
+    columns = set(table.column_names)
+    if not REQUIRED_COLUMNS.issubset(columns):
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {REQUIRED_COLUMNS - columns}")
 
-    # store as parquet (append or overwrite, we overwrite)
-    df.to_parquet(PRED_PATH, index=False)
-    write_meta()
-    return {"status": "ok", "rows_received": len(df)}
+    # append to the partitioned dataset
+    _write_predictions(_partitioned(table))
+    return {"status": "ok", "rows_received": table.num_rows}
 
 @app.post("/upload_json", response_model=PushResult)
-async def upload_json(payload: dict):
+def upload_json(payload: dict):
     """
     Accept a JSON payload with same structure:
     { rows: [ {timestamp:..., station_id:..., ...}, ... ] }
@@ -94,9 +368,45 @@ async def upload_json(payload: dict):
     if not rows:
         raise HTTPException(status_code=400, detail="No rows in payload")
     df = pd.DataFrame(rows)
-    if "timestamp" in df.columns:
+    if not REQUIRED_COLUMNS.issubset(set(df.columns)):
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {REQUIRED_COLUMNS - set(df.columns)}")
+    try:
         df["timestamp"] = pd.to_datetime(df["timestamp"])
-    df.to_parquet(PRED_PATH, index=False)
-    write_meta()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (ValueError, *CONFORM_ERRORS) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid column values: {e}")
+    _write_predictions(_partitioned(table))
     return {"status": "ok", "rows_received": len(df)}
 
+def _ingest_arrow(body, encoding):
+    try:
+        source = pa.BufferReader(body)
+        if encoding:
+            source = pa.CompressedInputStream(source, encoding)
+        table = pa.ipc.open_stream(source).read_all()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Arrow stream error: {e}")
+
+    columns = set(table.column_names)
+    if not REQUIRED_COLUMNS.issubset(columns):
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {REQUIRED_COLUMNS - columns}")
+
+    _write_predictions(_partitioned(table))
+    return table.num_rows
+
+@app.post("/upload_arrow", response_model=PushResult)
+async def upload_arrow(request: Request):
+    """
+    Accept an Arrow IPC stream (application/vnd.apache.arrow.stream) with the
+    same columns as /upload_csv. The body may be compressed, signalled with
+    Content-Encoding: zstd or gzip.
+    """
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    if encoding == "identity":
+        encoding = ""
+    if encoding and encoding not in ARROW_ENCODINGS:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    body = await request.body()
+    # the body has to be awaited, the decode and write then move off the event loop
+    rows_received = await run_in_threadpool(_ingest_arrow, body, encoding)
+    return {"status": "ok", "rows_received": rows_received}
@@ -0,0 +1,55 @@
+# backend/tests/test_predictions.py
+
+def row(timestamp, pollutant="NO2", station_id="S1", prediction=1.0):
+    return {
+        "timestamp": timestamp, "station_id": station_id, "station_name": "Station",
+        "lat": 28.6, "lon": 77.2, "pollutant": pollutant,
+        "prediction": prediction, "lower_q": 0.5, "upper_q": 1.5,
+    }
+
+def upload(client, rows):
+    r = client.post("/upload_json", json={"rows": rows})
+    assert r.status_code == 200, r.text
+
+def timestamps(client, query=""):
+    r = client.get(f"/predictions{query}")
+    assert r.status_code == 200, r.text
+    return [(x["timestamp"], x["pollutant"]) for x in r.json()["rows"]]
+
+def test_pollutant_filter_keeps_older_pollutant(client):
+    upload(client, [row("2025-01-01 00:00:00", "NO2")])
+    upload(client, [row(f"2025-01-0{d} 00:00:00", "O3") for d in range(2, 6)])
+    assert timestamps(client, "?pollutant=NO2") == [("2025-01-01 00:00:00", "NO2")]
+    assert ("2025-01-01 00:00:00", "NO2") in timestamps(client)
+
+def test_default_window_covers_whole_newest_upload(client):
+    upload(client, [row("2024-12-01 00:00:00")])
+    forecast = [row(f"2025-01-0{d} 12:00:00") for d in range(1, 8)]
+    upload(client, forecast)
+    assert timestamps(client) == [(r["timestamp"], "NO2") for r in forecast]
+
+def test_far_future_row_does_not_empty_window(client):
+    upload(client, [row("2099-01-01 00:00:00")])
+    forecast = [row(f"2025-01-0{d} 00:00:00") for d in range(1, 5)]
+    upload(client, forecast)
+    assert timestamps(client)[:4] == [(r["timestamp"], "NO2") for r in forecast]
+
+def test_resent_row_replaces_old_copy(client):
+    upload(client, [row("2025-01-01 05:00:00", prediction=1.0)])
+    upload(client, [row("2025-01-01 00:00:00"), row("2025-01-01 05:00:00", prediction=9.0)])
+    rows = client.get("/predictions").json()["rows"]
+    assert [(r["timestamp"], r["prediction"]) for r in rows] == [
+        ("2025-01-01 00:00:00", 1.0), ("2025-01-01 05:00:00", 9.0),
+    ]
+
+def test_missing_timestamp_is_rejected(client):
+    csv = (
+        "timestamp,station_id,station_name,lat,lon,pollutant,prediction,lower_q,upper_q\n"
+        "2025-01-01 00:00:00,S1,Station,28.6,77.2,NO2,1,0.5,1.5\n"
+        ",S1,Station,28.6,77.2,NO2,1,0.5,1.5\n"
+    )
+    r = client.post("/upload_csv", files={"file": ("p.csv", csv, "text/csv")})
+    assert r.status_code == 400
+    r = client.post("/upload_json", json={"rows": [row(None)]})
+    assert r.status_code == 400
+    assert timestamps(client) == []
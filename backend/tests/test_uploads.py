@@ -0,0 +1,67 @@
+# backend/tests/test_uploads.py
+import io
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pytest
+
+import main
+
+HEADER = "timestamp,station_id,station_name,lat,lon,pollutant,prediction,lower_q,upper_q\n"
+
+def csv_line(hour, station_id="S1", lower_q="1"):
+    return f"2025-01-01 {hour:02d}:00:00,{station_id},Station,28.6,77.2,NO2,2.0,{lower_q},3.0\n"
+
+@pytest.fixture
+def large_path(monkeypatch):
+    # route every CSV through the polars streaming path
+    monkeypatch.setattr(main, "LARGE_UPLOAD_BYTES", 1)
+
+def test_large_csv_types_match_small_path(client, large_path):
+    lines = [csv_line(h % 24, station_id=f"{h:03d}") for h in range(10, 310)] + [csv_line(0, "007", "8.5")]
+    r = client.post("/upload_csv", files={"file": ("p.csv", HEADER + "".join(lines), "text/csv")})
+    assert r.status_code == 200, r.text
+    rows = client.get("/predictions").json()["rows"]
+    assert {"007", "010", "309"} <= {x["station_id"] for x in rows}
+    assert [x["lower_q"] for x in rows if x["station_id"] == "007"] == [8.5]
+
+def test_large_csv_dedupes_against_small_path(client, monkeypatch):
+    client.post("/upload_csv", files={"file": ("p.csv", HEADER + csv_line(0, "007"), "text/csv")})
+    monkeypatch.setattr(main, "LARGE_UPLOAD_BYTES", 1)
+    client.post("/upload_csv", files={"file": ("p.csv", HEADER + csv_line(0, "007", "2.5"), "text/csv")})
+    rows = client.get("/predictions").json()["rows"]
+    assert [(x["station_id"], x["lower_q"]) for x in rows] == [("007", 2.5)]
+
+def test_failed_copy_leaves_no_temp_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    class Broken(io.RawIOBase):
+        def readinto(self, b):
+            raise OSError("client went away")
+
+    with pytest.raises(OSError):
+        main._sink_large_csv(Broken())
+    assert list(tmp_path.iterdir()) == []
+
+def arrow_body(compression=None):
+    table = pv.read_csv(io.BytesIO((HEADER + csv_line(0)).encode()))
+    sink = pa.BufferOutputStream()
+    out = pa.CompressedOutputStream(sink, compression) if compression else sink
+    with pa.ipc.new_stream(out, table.schema) as writer:
+        writer.write_table(table)
+    if compression:
+        out.close()
+    return sink.getvalue().to_pybytes()
+
+@pytest.mark.parametrize("encoding, compression", [
+    (None, None), ("identity", None), ("", None), ("ZSTD", "zstd"), ("gzip", "gzip"),
+])
+def test_arrow_content_encoding(client, encoding, compression):
+    headers = {"Content-Encoding": encoding} if encoding is not None else {}
+    r = client.post("/upload_arrow", content=arrow_body(compression), headers=headers)
+    assert r.status_code == 200, r.text
+
+def test_arrow_unsupported_encoding(client):
+    r = client.post("/upload_arrow", content=arrow_body(), headers={"Content-Encoding": "br"})
+    assert r.status_code == 415
@@ -1,35 +1,101 @@
 # frontend/app.py
+import os
+import contextlib
 import streamlit as st
 import pandas as pd
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pv
 import pydeck as pdk
 import altair as alt
+from joblib import Parallel, delayed, cpu_count
+from tsdownsample import LTTBDownsampler
 
 st.set_page_config(page_title="Delhi AQ Dashboard", layout="wide")
 st.title("🌍 Delhi Air Quality Dashboard")
 
 # --- DATA LOADING FUNCTIONS ---
+def _read_csv(csv_path, parse_dates=None):
+    # arrow's parser for the bulk of the file; date columns come in as text and are coerced,
+    # so a malformed value becomes NaT instead of failing the whole file
+    column_types = {col: pa.string() for col in parse_dates or []}
+    df = pv.read_csv(csv_path, convert_options=pv.ConvertOptions(column_types=column_types)).to_pandas()
+    for col in parse_dates or []:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+def _read_cached(csv_path, parse_dates=None):
+    # convert the CSV once, then reuse the parquet copy next to it
+    parquet_path = csv_path.replace(".csv", ".parquet")
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        return pd.read_parquet(parquet_path)
+    df = _read_csv(csv_path, parse_dates)
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, compression="zstd")
+        # other sessions see the old copy or the new one, never a partial file
+        os.replace(tmp_path, parquet_path)
+    except OSError:
+        # read-only checkout: serve this run straight from the CSV
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+    return df
+
 @st.cache_data
 def load_csv(path, parse_dates=None):
     try:
-        df = pd.read_csv(path)
-        if parse_dates:
-            for col in parse_dates:
-                if col in df.columns:
-                    df[col] = pd.to_datetime(df[col], errors="coerce")
-        return df
+        return _read_cached(path, parse_dates)
     except Exception as e:
         st.error(f"Error loading {path}: {e}")
         return None
 
+@st.cache_resource
+def load_indexed(path, *time_cols):
+    # sorted DatetimeIndex built once per process; cache_resource hands the same object
+    # to every session, so callers must not mutate it. The first of time_cols present
+    # in the file becomes the index
+    df = load_csv(path, parse_dates=list(time_cols))
+    if df is None:
+        return None
+    time_col = next((col for col in time_cols if col in df.columns), None)
+    if time_col is None:
+        st.error(f"Error loading {path}: no time column, expected one of {list(time_cols)}")
+        return None
+    return df.dropna(subset=[time_col]).set_index(time_col).sort_index(kind="stable")
+
+@st.cache_data(show_spinner=False)
+def latest_station_rows(path):
+    # latest reading per station via hash groupby + idxmax instead of a full sort, once per session
+    df = load_csv(path, parse_dates=["to"])
+    idx = df.dropna(subset=["to"]).groupby("station", sort=False)["to"].idxmax()
+    return df.loc[idx]
+
 # --- LOAD DATA ---
 stations_df = load_csv("stations.csv", parse_dates=["to"])
-forgraphs_df = load_csv("forgraphs.csv", parse_dates=["to date"])
-weather_df = load_csv("weather.csv", parse_dates=["valid_time"])
-forecast_df = load_csv("forecast.csv", parse_dates=["timestamp"])
+forgraphs_df = load_indexed("forgraphs.csv", "to date", "to")
+weather_df = load_indexed("weather.csv", "valid_time")
+forecast_df = load_indexed("forecast.csv", "timestamp")
 
 if stations_df is None or forgraphs_df is None or weather_df is None or forecast_df is None:
     st.stop()
 
+def native_step(index):
+    # median spacing between distinct timestamps, i.e. the source's own sampling interval
+    steps = np.diff(index.asi8)
+    steps = steps[steps > 0]
+    return pd.Timedelta(int(np.median(steps))) if len(steps) else None
+
+# sampling interval per source, detected once per session
+if "native_steps" not in st.session_state:
+    st.session_state["native_steps"] = {
+        "forgraphs": native_step(forgraphs_df.index),
+        "weather": native_step(weather_df.index),
+        "forecast": native_step(forecast_df.index),
+    }
+native_steps = st.session_state["native_steps"]
+
 # --- MASTER CONTROLS ---
 st.sidebar.header("📊 Master Controls")
 time_scope = st.sidebar.selectbox(
@@ -44,27 +110,147 @@ granularity = st.sidebar.selectbox(
     index=0
 )
 
+high_density = st.sidebar.toggle(
+    "High-density mode",
+    value=False,
+    help="Draw trend/weather lines with WebGL (pydeck) at full resolution instead of a downsampled Altair chart"
+)
+
 # --- HELPER FUNCTION FOR TIME FILTERING & RESAMPLING ---
-def filter_resample(df, time_col, numeric_cols):
+MAX_CHART_POINTS = 2000
+
+def downsample_lttb(df_plot, cols, n_out=MAX_CHART_POINTS):
+    # keep at most ~n_out points per line while preserving its visual shape (largest-triangle-three-buckets);
+    # only for what Altair draws, tables keep the full resampled frame
+    if len(df_plot) <= n_out:
+        return df_plot
+    x = df_plot["timestamp"].to_numpy().astype("int64")
+    keep = []
+    for c in cols:
+        y = df_plot[c].to_numpy(dtype="float64")
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) <= n_out:
+            keep.append(valid)
+        else:
+            keep.append(valid[LTTBDownsampler().downsample(x[valid], y[valid], n_out=n_out).astype(np.intp)])
+    return df_plot.iloc[np.unique(np.concatenate(keep))].reset_index(drop=True)
+
+def resample_frame(df, cols, scope, granularity, native=None):
+    # df carries a sorted DatetimeIndex, so the scope filter is a binary-search slice
     # Filter by time scope
-    max_time = df[time_col].max()
-    if time_scope == "Past Day":
+    max_time = df.index[-1]
+    if scope == "Past Day":
         start_time = max_time - pd.Timedelta(days=1)
-    elif time_scope == "Past Week":
+    elif scope == "Past Week":
         start_time = max_time - pd.Timedelta(weeks=1)
-    elif time_scope == "Past Month":
+    elif scope == "Past Month":
         start_time = max_time - pd.Timedelta(days=30)
-    elif time_scope == "Past Year":
+    elif scope == "Past Year":
         start_time = max_time - pd.Timedelta(days=365)
     else:
-        start_time = df[time_col].min()
-    df_filtered = df[df[time_col] >= start_time].copy()
-    
-    # Resample
-    df_filtered.set_index(time_col, inplace=True)
-    rule_map = {"Hourly":"1H", "Daily":"1D", "Weekly":"7D", "Monthly":"30D"}
-    df_resampled = df_filtered[numeric_cols].resample(rule_map[granularity]).mean().reset_index()
-    return df_resampled
+        start_time = df.index[0]
+    df_filtered = df.loc[start_time:, list(cols)]
+
+    # Resample with polars' native group_by_dynamic rather than pandas resample
+    rule_map = {"Hourly":"1h", "Daily":"1d", "Weekly":"7d", "Monthly":"30d"}
+    step = pd.Timedelta(rule_map[granularity])
+    if (native is not None and step <= native and df_filtered.index.is_unique
+            and not (df_filtered.index.asi8 % step.value).any()):
+        # already one row per bucket on the bucket grid, averaging would be a no-op
+        return df_filtered.rename_axis("timestamp").reset_index()
+    return (
+        pl.from_pandas(df_filtered.rename_axis("timestamp").reset_index())
+        .set_sorted("timestamp")
+        .group_by_dynamic("timestamp", every=rule_map[granularity])
+        .agg([pl.col(c).mean() for c in cols])
+        .to_pandas()
+    )
+
+_resampled = st.cache_data(show_spinner=False)(resample_frame)
+
+def _resample_chunk(chunk, cols, scope, granularity, native):
+    # runs in a joblib worker, so it must stay free of streamlit calls
+    return {station: resample_frame(df, cols, scope, granularity, native) for station, df in chunk}
+
+@st.cache_data(show_spinner=False)
+def resample_by_station(df, cols, scope, granularity, native=None):
+    # resample every station's series once, in parallel, so switching stations is a dict lookup
+    groups = list(df.dropna(subset=list(cols)).groupby("station", sort=False))
+    chunk_size = min(100, max(1, -(-len(groups) // cpu_count())))
+    chunks = [groups[i:i + chunk_size] for i in range(0, len(groups), chunk_size)]
+    results = Parallel(n_jobs=-1, backend="loky")(
+        delayed(_resample_chunk)(chunk, cols, scope, granularity, native) for chunk in chunks
+    )
+    return {station: frame for part in results for station, frame in part.items()}
+
+def filter_resample(df, numeric_cols, native=None):
+    # cached on the frame plus the master controls, so reruns from unrelated widgets skip the resample
+    return _resampled(df, tuple(numeric_cols), time_scope, granularity, native)
+
+# --- HELPER FUNCTION FOR MAP COLORS ---
+def station_colors(vals):
+    # vectorised traffic-light colors as an (N, 3) uint8 array, grey for missing values
+    vals = np.asarray(vals, dtype=np.float32)
+    colors = np.full((len(vals), 3), 180, dtype=np.uint8)
+    colors[vals < 40] = (0, 255, 0)
+    colors[(vals >= 40) & (vals < 80)] = (255, 255, 0)
+    colors[vals >= 80] = (255, 0, 0)
+    return colors
+
+# --- HELPER FUNCTION FOR HIGH-DENSITY LINES ---
+def deck_line_chart(df_plot, col, color=(255, 75, 75), width=1000, height=300):
+    # draw the series as LineLayer segments in a flat (orthographic) plane, time on x and value on y
+    data = df_plot[["timestamp", col]].dropna()
+    ts = data["timestamp"].to_numpy().astype("int64")
+    vals = data[col].to_numpy(dtype="float64")
+    if len(ts):
+        x = (ts - ts.min()) / max(ts.max() - ts.min(), 1) * width
+        # orthographic y grows downwards, flip so larger values sit higher
+        y = height - (vals - vals.min()) / max(vals.max() - vals.min(), 1e-9) * height
+    else:
+        x = y = np.empty(0)
+    points = np.column_stack([x, y])
+    segments = pd.DataFrame({"source": points[:-1].tolist(), "target": points[1:].tolist()})
+    # invisible but pickable dots carry the readable values for the hover tooltip
+    markers = pd.DataFrame({
+        "position": points.tolist(),
+        "time": data["timestamp"].dt.strftime("%Y-%m-%d %H:%M").to_numpy(),
+        "value": np.char.mod("%.2f", vals),
+    })
+
+    layer = pdk.Layer(
+        "LineLayer",
+        data=segments,
+        get_source_position="source",
+        get_target_position="target",
+        get_color=list(color),
+        get_width=2,
+    )
+    hover = pdk.Layer(
+        "ScatterplotLayer",
+        data=markers,
+        get_position="position",
+        get_radius=4,
+        radius_units="pixels",
+        get_fill_color=list(color) + [0],
+        pickable=True,
+    )
+    return pdk.Deck(
+        layers=[layer, hover],
+        views=[pdk.View(type="OrthographicView", controller=True)],
+        initial_view_state=pdk.ViewState(target=[width / 2, height / 2, 0], zoom=0),
+        map_style=None,
+        tooltip={"text": f"{{time}}\n{col}: {{value}}"},
+    )
+
+def deck_axis_caption(df_plot, col, unit=""):
+    # the orthographic view has no axes, so spell out what the corners of the plot mean
+    data = df_plot[["timestamp", col]].dropna()
+    if data.empty:
+        return "No data in the selected range"
+    ts, vals = data["timestamp"], data[col]
+    return (f"x: {ts.min():%Y-%m-%d %H:%M} → {ts.max():%Y-%m-%d %H:%M} · "
+            f"y: {vals.min():.2f} → {vals.max():.2f} {unit}").rstrip()
 
 # --- MAIN TABS ---
 main_tabs = st.tabs(["🌫️ Pollution", "🌦️ Weather", "🔮 Predictions"])
@@ -82,24 +268,22 @@ with main_tabs[0]:
         pollutant_choice = st.radio("Select Pollutant", ["NO2", "O3"], horizontal=True)
         pollutant_col = "no2" if pollutant_choice == "NO2" else "o3"
 
-        latest_station_data = stations_df.sort_values("to").drop_duplicates("station", keep="last")
+        latest_station_data = latest_station_rows("stations.csv")
 
-        def get_color(val):
-            if pd.isna(val): 
-                return [180, 180, 180]
-            val = float(val)
-            if val < 40: return [0, 255, 0]
-            elif val < 80: return [255, 255, 0]
-            else: return [255, 0, 0]
-
-        latest_station_data["color"] = latest_station_data[pollutant_col].apply(get_color)
+        # ship only what the layer draws and the tooltip shows, not every feature column
+        map_data = pd.DataFrame({
+            "station": latest_station_data["station"].to_numpy(),
+            pollutant_col: latest_station_data[pollutant_col].to_numpy(),
+            "position": latest_station_data[["Longitude", "Latitude"]].to_numpy().tolist(),
+            "color": station_colors(latest_station_data[pollutant_col]).tolist(),
+        })
 
         view_state = pdk.ViewState(latitude=28.6139, longitude=77.2090, zoom=9.5, pitch=50)
 
         layer = pdk.Layer(
             "ScatterplotLayer",
-            data=latest_station_data,
-            get_position="[Longitude, Latitude]",
+            data=map_data,
+            get_position="position",
             get_fill_color="color",
             get_radius=800,
             pickable=True,
@@ -122,30 +306,34 @@ with main_tabs[0]:
         pollutant_map = {"NO2": "no2", "O3": "ozone"}
         pollutant_col = pollutant_map[pollutant_graph_choice]
 
-        time_col = "to date" if "to date" in forgraphs_df.columns else "to"
-        df = forgraphs_df[[time_col, pollutant_col]].dropna().rename(columns={time_col:"timestamp"})
-        df_plot = filter_resample(df, "timestamp", [pollutant_col])
+        df = forgraphs_df[[pollutant_col]].dropna()
+        df_plot = filter_resample(df, [pollutant_col], native_steps["forgraphs"])
 
-        nearest = alt.selection_point(nearest=True, on="mouseover", fields=["timestamp"], empty="none")
+        if high_density:
+            st.pydeck_chart(deck_line_chart(df_plot, pollutant_col))
+            st.caption(deck_axis_caption(df_plot, pollutant_col, "µg/m³"))
+        else:
+            df_chart = downsample_lttb(df_plot, [pollutant_col])
+            nearest = alt.selection_point(nearest=True, on="mouseover", fields=["timestamp"], empty="none")
 
-        line = alt.Chart(df_plot).mark_line().encode(
-            x="timestamp:T",
-            y=alt.Y(f"{pollutant_col}:Q", title="Concentration (µg/m³)"),
-            tooltip=[alt.Tooltip("timestamp:T"), alt.Tooltip(f"{pollutant_col}:Q", format=".2f")]
-        )
+            line = alt.Chart(df_chart).mark_line().encode(
+                x="timestamp:T",
+                y=alt.Y(f"{pollutant_col}:Q", title="Concentration (µg/m³)"),
+                tooltip=[alt.Tooltip("timestamp:T"), alt.Tooltip(f"{pollutant_col}:Q", format=".2f")]
+            )
 
-        points = line.mark_circle(size=60, opacity=0).encode(
-            opacity=alt.condition(nearest, alt.value(1), alt.value(0))
-        )
+            points = line.mark_circle(size=60, opacity=0).encode(
+                opacity=alt.condition(nearest, alt.value(1), alt.value(0))
+            )
 
-        rule = alt.Chart(df_plot).mark_rule(color="gray").encode(
-            x="timestamp:T",
-            opacity=alt.condition(nearest, alt.value(0.3), alt.value(0)),
-            tooltip=[alt.Tooltip("timestamp:T", format="%Y-%m-%d %H:%M"),
-                     alt.Tooltip(f"{pollutant_col}:Q", format=".2f")]
-        ).add_params(nearest)
+            rule = alt.Chart(df_chart).mark_rule(color="gray").encode(
+                x="timestamp:T",
+                opacity=alt.condition(nearest, alt.value(0.3), alt.value(0)),
+                tooltip=[alt.Tooltip("timestamp:T", format="%Y-%m-%d %H:%M"),
+                         alt.Tooltip(f"{pollutant_col}:Q", format=".2f")]
+            ).add_params(nearest)
 
-        st.altair_chart(alt.layer(line, points, rule).interactive(), use_container_width=True)
+            st.altair_chart(alt.layer(line, points, rule).interactive(), use_container_width=True)
 
         with st.expander("📊 View Data Table"):
             st.dataframe(df_plot, use_container_width=True)
@@ -175,33 +363,37 @@ with main_tabs[1]:
     }
 
     col, unit = mapping[variable]
-    df = weather_df.copy()
-    df_plot = filter_resample(df.rename(columns={"valid_time":"timestamp"}), "timestamp", [col])
+    df_plot = filter_resample(weather_df, [col], native_steps["weather"])
 
     if col == "t2m":
         df_plot[col] = df_plot[col] - 273.15
         unit = "°C"
 
-    nearest = alt.selection_point(nearest=True, on="timestamp", fields=["timestamp"], empty="none")
+    if high_density:
+        st.pydeck_chart(deck_line_chart(df_plot, col))
+        st.caption(deck_axis_caption(df_plot, col, unit))
+    else:
+        df_chart = downsample_lttb(df_plot, [col])
+        nearest = alt.selection_point(nearest=True, on="timestamp", fields=["timestamp"], empty="none")
 
-    line = alt.Chart(df_plot).mark_line().encode(
-        x="timestamp:T",
-        y=alt.Y(f"{col}:Q", title=f"{variable} ({unit})"),
-        tooltip=[alt.Tooltip("timestamp:T"), alt.Tooltip(f"{col}:Q", format=".2f")]
-    )
+        line = alt.Chart(df_chart).mark_line().encode(
+            x="timestamp:T",
+            y=alt.Y(f"{col}:Q", title=f"{variable} ({unit})"),
+            tooltip=[alt.Tooltip("timestamp:T"), alt.Tooltip(f"{col}:Q", format=".2f")]
+        )
 
-    points = line.mark_circle(size=60, opacity=0).encode(
-        opacity=alt.condition(nearest, alt.value(1), alt.value(0))
-    )
+        points = line.mark_circle(size=60, opacity=0).encode(
+            opacity=alt.condition(nearest, alt.value(1), alt.value(0))
+        )
 
-    rule = alt.Chart(df_plot).mark_rule(color="gray").encode(
-        x="timestamp:T",
-        opacity=alt.condition(nearest, alt.value(0.3), alt.value(0)),
-        tooltip=[alt.Tooltip("timestamp:T", format="%Y-%m-%d %H:%M"),
-                 alt.Tooltip(f"{col}:Q", format=".2f")]
-    ).add_params(nearest)
+        rule = alt.Chart(df_chart).mark_rule(color="gray").encode(
+            x="timestamp:T",
+            opacity=alt.condition(nearest, alt.value(0.3), alt.value(0)),
+            tooltip=[alt.Tooltip("timestamp:T", format="%Y-%m-%d %H:%M"),
+                     alt.Tooltip(f"{col}:Q", format=".2f")]
+        ).add_params(nearest)
 
-    st.altair_chart(alt.layer(line, points, rule).interactive(), use_container_width=True)
+        st.altair_chart(alt.layer(line, points, rule).interactive(), use_container_width=True)
 
     with st.expander("📊 View Weather Table"):
         st.dataframe(df_plot[["timestamp", col]].dropna(), use_container_width=True)
@@ -214,9 +406,9 @@ with main_tabs[2]:
     stations_list = forecast_df["station"].unique()
     selected_station = st.selectbox("Select Station:", stations_list)
 
-    df = forecast_df[forecast_df["station"] == selected_station].dropna(subset=["pred_no2","pred_o3"])
-    df_plot = filter_resample(df, "timestamp", ["pred_no2","pred_o3"])
-    melted = df_plot.melt("timestamp", var_name="Pollutant", value_name="Value")
+    station_frames = resample_by_station(forecast_df, ("pred_no2","pred_o3"), time_scope, granularity, native_steps["forecast"])
+    df_plot = station_frames.get(selected_station, pd.DataFrame(columns=["timestamp","pred_no2","pred_o3"]))
+    melted = downsample_lttb(df_plot, ["pred_no2", "pred_o3"]).melt("timestamp", var_name="Pollutant", value_name="Value")
 
     nearest = alt.selection_point(nearest=True, on="timestamp", fields=["timestamp"], empty="none")
 
@@ -1,19 +1,53 @@
 # ingest/push_predictions.py
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import pyarrow as pa
+import pyarrow.csv as pv
+from pathlib import Path
 import sys
-import time
 
 BACKEND = "http://localhost:8000"  # change if needed
 
-def push_csv(csv_path):
-    files = {"file": open(csv_path, "rb")}
-    r = requests.post(f"{BACKEND}/upload_csv", files=files)
+def make_session():
+    # keep-alive pool shared across pushes; POSTs are only retried when the connection itself fails
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _post(session, url, **kwargs):
+    # reuse the caller's pooled session, or open a one-off one for a single push
+    if session is not None:
+        return session.post(url, **kwargs)
+    with make_session() as own:
+        return own.post(url, **kwargs)
+
+def push_csv(csv_path, session=None):
+    with open(csv_path, "rb") as fh:
+        files = {"file": (Path(csv_path).name, fh, "text/csv")}
+        r = _post(session, f"{BACKEND}/upload_csv", files=files, timeout=60)
+    print("status", r.status_code, r.text)
+
+def push_arrow(csv_path, session=None):
+    # parse locally and ship a zstd-compressed Arrow IPC stream, the server reads it without any text parsing
+    table = pv.read_csv(csv_path)
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, "zstd") as out, pa.ipc.new_stream(out, table.schema) as writer:
+        writer.write_table(table)
+    headers = {"Content-Type": "application/vnd.apache.arrow.stream", "Content-Encoding": "zstd"}
+    r = _post(session, f"{BACKEND}/upload_arrow", data=sink.getvalue().to_pybytes(), headers=headers, timeout=60)
     print("status", r.status_code, r.text)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python push_predictions.py path/to/predictions.csv")
+    args = sys.argv[1:]
+    use_arrow = "--arrow" in args
+    paths = [a for a in args if a != "--arrow"]
+    if not paths:
+        print("Usage: python push_predictions.py [--arrow] path/to/predictions.csv [more.csv ...]")
         sys.exit(1)
-    push_csv(sys.argv[1])
-
+    push = push_arrow if use_arrow else push_csv
+    with make_session() as session:
+        for csv_path in paths:
+            push(csv_path, session)